@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import multiprocessing
+import os
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_haproxy import start_fake_haproxy
+
+__author__ = "Armon Dressler"
+__license__ = "BSD2C"
+__version__ = "0.4"
+__email__ = "armon.dressler@gmail.com"
+
+'''
+Benchmark for check_haproxy_health.py against fake haproxy processes (see fake_haproxy.py).
+
+Runs the plugin once per metric and mode and reports its wall time, the number
+of socket round-trips and bytes haproxy had to send, and the peak RSS of the
+plugin process. Results can be saved with --json and compared to a previous
+run with --compare to catch regressions, the exit code is 1 if any were found.
+The startup mode runs the plugin with --help under python -X importtime and
+reports the time spent importing modules, --startup-budget fails the run if
+that exceeds the given milliseconds.
+'''
+
+MODE_METRICS = {
+    "frontend": ["http_4XX_pct", "http_5XX_pct", "session_capacity_pct", "total_megabytes_in",
+                 "total_megabytes_out", "error_requests", "denied_requests", "new_sessions", "new_requests"],
+    "backend": ["active_servers", "http_4XX_pct", "http_5XX_pct", "queue_capacity_pct", "average_response_time",
+                "backend_failures", "queue_time", "total_megabytes_out", "denied_requests", "new_sessions"],
+    "server": ["http_5XX_pct", "session_capacity_pct", "queue_capacity_pct", "average_response_time",
+               "backend_failures", "queue_time"],
+    # the same server in every backend, with --merge-backends
+    "merged": ["http_5XX_pct", "session_capacity_pct", "queue_time"],
+    "scan": [None],
+    "startup": [None]
+}
+MODE_ARGUMENTS = {
+    "frontend": ["--frontend", "fe0"],
+    "backend": ["--backend", "be0"],
+    "server": ["--server", "be0/srv0"],
+    "merged": ["--server", "srv0", "--merge-backends"],
+    "scan": ["--scan"],
+    "startup": ["--help"]
+}
+# fields checked by --compare, an increase beyond --tolerance counts as regression
+COMPARED_FIELDS = ("wall_ms", "round_trips", "bytes_read", "peak_rss_mb", "import_ms")
+
+
+def parse_importtime(lines):
+    # "import time: self [us] | cumulative | imported package", nested imports are indented
+    imports = []
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            imports.append((name.strip(), int(cumulative) / 1000))
+    return sorted(imports, key=lambda item: item[1], reverse=True)
+
+
+class FakeHaproxyProcess(object):
+    """Fake haproxies served from a child process.
+
+    Keeps the generated topology out of the benchmark process, plugin processes
+    forked from it would otherwise report its memory as their peak RSS.
+    """
+
+    def __init__(self, socket_file=None, socketdir=None, processes=1, **topology):
+        self._connection, child_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=self._serve, daemon=True,
+                                                args=(child_connection, socket_file, socketdir, processes, topology))
+        self._process.start()
+        self.socket_files = self._connection.recv()
+
+    @staticmethod
+    def _serve(connection, socket_file, socketdir, processes, topology):
+        fakes = start_fake_haproxy(socket_file, socketdir, processes, **topology)
+        connection.send([fake.socket_file for fake in fakes])
+        while True:
+            request = connection.recv()
+            if request == "reset":
+                for fake in fakes:
+                    fake.reset_stats()
+                connection.send(None)
+            elif request == "stats":
+                connection.send((sum([fake.connections for fake in fakes]),
+                                 sum([fake.bytes_sent for fake in fakes])))
+            else:
+                for fake in fakes:
+                    fake.stop()
+                connection.send(None)
+                return
+
+    def request(self, request):
+        self._connection.send(request)
+        return self._connection.recv()
+
+    def stop(self):
+        self.request("stop")
+        self._process.join()
+
+
+def run_plugin(command, fakes):
+    fakes.request("reset")
+    started = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.stdout.read()
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.time() - started
+    process.stdout.close()
+    round_trips, bytes_read = fakes.request("stats")
+    lines = output.decode(errors="replace").splitlines()
+    imports = parse_importtime(lines)
+    lines = [line for line in lines if not line.startswith("import time:")]
+    return {
+        "wall_ms": round(wall_time * 1000, 1),
+        "round_trips": round_trips,
+        "bytes_read": bytes_read,
+        # ru_maxrss is in kilobytes on linux
+        "peak_rss_mb": round(rusage.ru_maxrss / 1024, 1),
+        "exitcode": os.waitstatus_to_exitcode(status),
+        "import_ms": round(sum([milliseconds for _, milliseconds in imports]), 1),
+        "top_imports": ", ".join(["{} {:.1f}".format(name, milliseconds) for name, milliseconds in imports[:3]]),
+        "output": lines[0] if lines else ""
+    }
+
+
+def run_benchmark(args, fakes, socket_arguments):
+    results = []
+    for mode in args.modes:
+        for metric in MODE_METRICS[mode]:
+            if mode == "startup":
+                command = [sys.executable, "-X", "importtime", args.plugin] + MODE_ARGUMENTS[mode]
+            else:
+                command = [sys.executable, args.plugin] + socket_arguments + MODE_ARGUMENTS[mode]
+            if metric:
+                command += ["--metric", metric]
+            command += shlex.split(args.plugin_args)
+            runs = [run_plugin(command, fakes) for _ in range(args.repeat)]
+            result = dict(runs[-1], mode=mode, metric=metric or "-")
+            result["wall_ms"] = round(statistics.median([run["wall_ms"] for run in runs]), 1)
+            result["peak_rss_mb"] = max([run["peak_rss_mb"] for run in runs])
+            result["import_ms"] = round(statistics.median([run["import_ms"] for run in runs]), 1)
+            results.append(result)
+            print("{mode:<9} {metric:<22} {wall_ms:>9} {round_trips:>6} {bytes_read:>12} {peak_rss_mb:>8} "
+                  "{exitcode:>4}".format(**result))
+            if mode == "startup":
+                print("{:>10}imports took {} ms, slowest: {}".format("", result["import_ms"], result["top_imports"]))
+            if result["exitcode"] not in (0, 1, 2):
+                print("{:>10}{}".format("", result["output"]))
+    return results
+
+
+def compare(results, baseline_file, tolerance):
+    with open(baseline_file) as baseline:
+        baseline_results = {(result["mode"], result["metric"]): result for result in json.load(baseline)["results"]}
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get((result["mode"], result["metric"]))
+        if baseline_result is None:
+            continue
+        for field in COMPARED_FIELDS:
+            # baselines saved before a field was added can't be compared on it
+            if field not in baseline_result:
+                continue
+            if result[field] > baseline_result[field] * (1 + tolerance):
+                regressions.append("{} {}: {} went from {} to {}".format(
+                    result["mode"], result["metric"], field, baseline_result[field], result[field]))
+    return regressions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--plugin', action='store',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'check_haproxy_health.py'),
+                        help='plugin to benchmark, e.g. an older version for comparison')
+    parser.add_argument('--plugin-args', action='store', default='--nozerocounters',
+                        help='additional arguments for every plugin run (default: --nozerocounters)')
+    parser.add_argument('--modes', action='store', default='frontend,backend,server,scan,startup',
+                        type=lambda modes: modes.split(','),
+                        help='comma separated list of modes to benchmark, merged is left out by default\
+                            (default: frontend,backend,server,scan,startup)')
+    parser.add_argument('--frontends', action='store', type=int, default=10,
+                        help='number of frontends of the fake haproxy')
+    parser.add_argument('--backends', action='store', type=int, default=200,
+                        help='number of backends of the fake haproxy')
+    parser.add_argument('--servers', action='store', type=int, default=20,
+                        help='number of servers per backend of the fake haproxy')
+    parser.add_argument('--processes', action='store', type=int, default=1,
+                        help='number of fake haproxy processes, more than one uses --socketdir')
+    parser.add_argument('--latency', action='store', type=float, default=0, metavar='SECONDS',
+                        help='delay of the fake haproxy before answering a request')
+    parser.add_argument('--repeat', action='store', type=int, default=3,
+                        help='runs per metric, the median wall time is reported')
+    parser.add_argument('--json', action='store', metavar='FILE',
+                        help='save results to FILE')
+    parser.add_argument('--compare', action='store', metavar='FILE',
+                        help='compare results to a previous run saved with --json')
+    parser.add_argument('--tolerance', action='store', type=float, default=0.2,
+                        help='relative increase tolerated by --compare (default: 0.2)')
+    parser.add_argument('--startup-budget', action='store', type=float, metavar='MS',
+                        help='fail if importing modules at startup takes longer than MS milliseconds')
+    args = parser.parse_args()
+    for mode in args.modes:
+        if mode not in MODE_METRICS:
+            parser.error("unknown mode {}, use any of {}".format(mode, ", ".join(MODE_METRICS)))
+    return args
+
+
+def main():
+    args = parse_arguments()
+    tmpdir = tempfile.mkdtemp(prefix="check_haproxy_health_benchmark_")
+    topology = dict(frontends=args.frontends, backends=args.backends, servers=args.servers, latency=args.latency)
+    try:
+        if args.processes > 1:
+            socketdir = os.path.join(tmpdir, "sockets")
+            fakes = FakeHaproxyProcess(socketdir=socketdir, processes=args.processes, **topology)
+            socket_arguments = ["-s", socketdir]
+        else:
+            fakes = FakeHaproxyProcess(os.path.join(tmpdir, "haproxy.sock"), **topology)
+            socket_arguments = ["-f", fakes.socket_files[0]]
+        print("{} process(es), {} frontends, {} backends x {} servers, {}s latency".format(
+            args.processes, args.frontends, args.backends, args.servers, args.latency))
+        print("{:<9} {:<22} {:>9} {:>6} {:>12} {:>8} {:>4}".format(
+            "mode", "metric", "wall_ms", "trips", "bytes_read", "rss_mb", "rc"))
+        results = run_benchmark(args, fakes, socket_arguments)
+        fakes.stop()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"topology": topology, "processes": args.processes, "plugin_args": args.plugin_args,
+                       "results": results}, json_file, indent=2)
+    regressions = []
+    if args.compare:
+        regressions += compare(results, args.compare, args.tolerance)
+    if args.startup_budget is not None:
+        regressions += ["startup: imports took {} ms, budget is {} ms".format(result["import_ms"], args.startup_budget)
+                        for result in results
+                        if result["mode"] == "startup" and result["import_ms"] > args.startup_budget]
+    for regression in regressions:
+        print("REGRESSION {}".format(regression))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
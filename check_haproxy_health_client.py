@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import socket
+import struct
+import sys
+
+__author__ = "Armon Dressler"
+__license__ = "BSD2C"
+__version__ = "0.4"
+__email__ = "armon.dressler@gmail.com"
+
+'''
+Thin client for check_haproxy_health.py --daemon.
+
+Takes the same arguments as check_haproxy_health.py and lets the daemon run
+the check against its in-memory stats. Only the standard library needed to
+talk to the daemon is imported, so a check finishes in a few milliseconds.
+If the daemon can't answer, the check is run directly like before.
+'''
+
+TIMEOUT = 10
+
+
+def get_default_daemon_socket():
+    # same as check_haproxy_health.get_default_daemon_socket(), which is not imported to start fast
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp/check_haproxy_health-{}".format(os.getuid())
+    return os.path.join(runtime_dir, "check_haproxy_health.sock")
+
+
+def get_daemon_socket(argv):
+    for index, arg in enumerate(argv):
+        if arg == "--daemon-socket" and index + 1 < len(argv):
+            return argv[index + 1]
+        if arg.startswith("--daemon-socket="):
+            return arg.split("=", 1)[1]
+    return get_default_daemon_socket()
+
+
+def query_daemon(argv):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(TIMEOUT)
+    try:
+        client.connect(get_daemon_socket(argv))
+        if hasattr(socket, "SO_PEERCRED"):
+            # don't hand the check to a daemon somebody else started on that path
+            _, uid, _ = struct.unpack("3i", client.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                                              struct.calcsize("3i")))
+            if uid not in (0, os.getuid()):
+                raise ValueError("daemon socket is served by uid {}".format(uid))
+        client.sendall(json.dumps(argv).encode() + b"\n")
+        response = client.makefile("rb").readline()
+    finally:
+        client.close()
+    return json.loads(response.decode())
+
+
+def main():
+    argv = sys.argv[1:]
+    try:
+        response = query_daemon(argv)
+    except (OSError, ValueError):
+        response = {"fallback": "daemon not available"}
+    if "fallback" in response:
+        # run the check in this process, just like check_haproxy_health.py would
+        import check_haproxy_health
+        check_haproxy_health.main(argv)
+        return
+    sys.stdout.write(response["output"])
+    sys.exit(response["exitcode"])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+__author__ = "Armon Dressler"
+__license__ = "BSD2C"
+__version__ = "0.4"
+__email__ = "armon.dressler@gmail.com"
+
+'''
+Stand-in for the stats socket of a haproxy process, for testing and benchmarking
+check_haproxy_health.py without a real haproxy.
+
+Emulates "show info", "show stat [<iid> <type> <sid>]" (with server side filtering)
+and "clear counters [all]" for a generated topology of frontends, backends and
+servers. Counters grow every second at a random but reproducible rate, gauges are
+fixed. Commands may be chained with ";" like haproxy allows. The socket is a unix
+socket or, given as tcp://host:port, bound to an address. --http additionally
+serves the stats page CSV export (/stats;csv) with keep-alive.
+'''
+
+STAT_HEADER = ("pxname,svname,qcur,qmax,scur,smax,slim,stot,bin,bout,dreq,dresp,ereq,econ,eresp,wretr,wredis,"
+               "status,weight,act,bck,chkfail,chkdown,lastchg,downtime,qlimit,pid,iid,sid,throttle,lbtot,tracked,"
+               "type,rate,rate_lim,rate_max,check_status,check_code,check_duration,hrsp_1xx,hrsp_2xx,hrsp_3xx,"
+               "hrsp_4xx,hrsp_5xx,hrsp_other,hanafail,req_rate,req_rate_max,req_tot,cli_abrt,srv_abrt,comp_in,"
+               "comp_out,comp_byp,comp_rsp,lastsess,last_chk,last_agt,qtime,ctime,rtime,ttime,agent_status,"
+               "agent_code,agent_duration,check_desc,agent_desc,check_rise,check_fall,check_health,agent_rise,"
+               "agent_fall,agent_health,addr,cookie,mode,algo,conn_rate,conn_rate_max,conn_tot,intercepted,dcon,"
+               "dses").split(",")
+COUNTERS = ("stot", "bin", "bout", "dreq", "ereq", "econ", "eresp", "hrsp_1xx", "hrsp_2xx", "hrsp_3xx",
+            "hrsp_4xx", "hrsp_5xx", "hrsp_other", "req_tot", "lbtot", "cli_abrt", "srv_abrt")
+TYPE_FRONTEND = 0
+TYPE_BACKEND = 1
+TYPE_SERVER = 2
+
+
+class FakeHaproxy(object):
+    """A single fake haproxy process listening on socket_file.
+
+    connections, commands and bytes_sent count what clients cost the process,
+    reset them with reset_stats().
+    """
+
+    def __init__(self, socket_file, frontends=2, backends=3, servers=4, latency=0, process_num=1, seed=0):
+        self.socket_file = socket_file
+        self.latency = latency
+        self.process_num = process_num
+        self.started = time.time()
+        self.cleared_tick = 0
+        self.rows = []
+        self._rendered = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._listening = threading.Event()
+        self._http_server = None
+        self.reset_stats()
+        self._build(frontends, backends, servers, random.Random(seed))
+
+    def reset_stats(self):
+        self.connections = 0
+        self.commands = 0
+        self.bytes_sent = 0
+
+    def _build(self, frontends, backends, servers, rand):
+        # every row keeps its static fields and a growth rate per counter
+        def row(pxname, svname, obj_type, iid, sid, status, **fields):
+            values = dict.fromkeys(STAT_HEADER, "")
+            values.update(pxname=pxname, svname=svname, type=obj_type, iid=iid, sid=sid, status=status,
+                          pid=self.process_num, scur=rand.randint(0, 200), smax=rand.randint(200, 400),
+                          rate=rand.randint(0, 50), rate_max=rand.randint(50, 100))
+            values.update(fields)
+            rates = {counter: rand.randint(0, 20) for counter in COUNTERS if values[counter] != ""}
+            rates["hrsp_2xx"] = rand.randint(50, 100)
+            rates["bin"] = rates["bout"] = rand.randint(1000, 100000)
+            if "req_tot" in rates:
+                rates["req_tot"] = sum([rates[counter] for counter in rates if counter.startswith("hrsp_")])
+            self.rows.append((obj_type, iid, sid, values, rates))
+
+        counters = dict.fromkeys(COUNTERS, 0)
+        for index in range(frontends):
+            fields = dict(counters, econ="", eresp="", lbtot="", srv_abrt="", slim=2000,
+                          req_rate=rand.randint(0, 100), mode="http")
+            row("fe{}".format(index), "FRONTEND", TYPE_FRONTEND, index + 1, 0, "OPEN", **fields)
+        backend_counters = dict(counters, req_tot="", ereq="")
+        for index in range(backends):
+            iid = frontends + index + 1
+            pxname = "be{}".format(index)
+            for server in range(servers):
+                status = "DOWN" if rand.random() < 0.05 else "UP"
+                row(pxname, "srv{}".format(server), TYPE_SERVER, iid, server + 1, status, slim=100,
+                    qcur=rand.randint(0, 5), qmax=rand.randint(5, 20), qtime=rand.randint(0, 10),
+                    rtime=rand.randint(1, 200), weight=1, act=1, bck=0, check_status="L7OK",
+                    addr="10.0.{}.{}:80".format(index % 256, server % 256),
+                    **dict(backend_counters, dreq=""))
+            row(pxname, "BACKEND", TYPE_BACKEND, iid, 0, "UP", qcur=rand.randint(0, 20), qmax=rand.randint(20, 50),
+                qtime=rand.randint(0, 10), rtime=rand.randint(1, 200), weight=servers, act=servers, bck=0,
+                mode="http", algo="roundrobin", **backend_counters)
+
+    def _tick(self):
+        return int(time.time() - self.started) + 1
+
+    def info(self):
+        uptime = int(time.time() - self.started)
+        return ("Name: HAProxy\nVersion: 1.8.30\nRelease_date: 2021/04/12\nNbproc: 1\n"
+                "Process_num: {}\nPid: {}\nUptime: 0d 0h00m{:02d}s\nUptime_sec: {}\nMaxconn: 20000\n"
+                "CurrConns: 1\nSessRateLimit: 0\nnode: fakehaproxy\ndescription: \n\n").format(
+                    self.process_num, 4000 + self.process_num, uptime % 60, uptime)
+
+    def stat(self, iid=-1, obj_type=-1, sid=-1):
+        tick = self._tick()
+        key = (tick, self.cleared_tick, iid, obj_type, sid)
+        with self._lock:
+            if key not in self._rendered:
+                self._rendered = {key: self._render(tick - self.cleared_tick, iid, obj_type, sid)}
+            return self._rendered[key]
+
+    def _render(self, elapsed, iid, obj_type, sid):
+        lines = ["# " + ",".join(STAT_HEADER) + ","]
+        for row_type, row_iid, row_sid, values, rates in self.rows:
+            if iid != -1 and row_iid != iid:
+                continue
+            if obj_type != -1 and not obj_type & (1 << row_type):
+                continue
+            if sid != -1 and row_type == TYPE_SERVER and row_sid != sid:
+                continue
+            values = dict(values)
+            for counter, rate in rates.items():
+                values[counter] = rate * elapsed
+            lines.append(",".join([str(values[column]) for column in STAT_HEADER]) + ",")
+        return ("\n".join(lines) + "\n\n").encode()
+
+    def execute(self, command):
+        words = command.split()
+        if words[:2] == ["show", "info"]:
+            return self.info().encode()
+        elif words[:2] == ["show", "stat"]:
+            try:
+                return self.stat(*[int(word) for word in words[2:5]])
+            except ValueError:
+                return b"Unknown command.\n\n"
+        elif words[:2] == ["clear", "counters"]:
+            self.cleared_tick = self._tick()
+            return b"\n"
+        return b"Unknown command.\n\n"
+
+    def handle(self, connection):
+        try:
+            request = b""
+            while not request.endswith(b"\n"):
+                chunk = connection.recv(4096)
+                if not chunk:
+                    break
+                request += chunk
+            if self.latency:
+                time.sleep(self.latency)
+            for command in request.decode().strip().split(";"):
+                output = self.execute(command.strip())
+                connection.sendall(output)
+                with self._lock:
+                    self.commands += 1
+                    self.bytes_sent += len(output)
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+    def serve_forever(self):
+        if self.socket_file.startswith("tcp://"):
+            host, _, port = self.socket_file[len("tcp://"):].rpartition(":")
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind((host, int(port)))
+        else:
+            if os.path.exists(self.socket_file):
+                os.unlink(self.socket_file)
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(self.socket_file)
+        self._server.listen(128)
+        self._listening.set()
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                break
+            with self._lock:
+                self.connections += 1
+            threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def start(self, http_address=None):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        # clients connecting right after start() must not be refused
+        if not self._listening.wait(10):
+            raise OSError("Fake haproxy failed to listen on {}".format(self.socket_file))
+        if http_address:
+            self.start_http(http_address)
+        return self
+
+    def start_http(self, http_address):
+        fake = self
+
+        class StatsPageHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with fake._lock:
+                    fake.connections += 1
+
+            def handle(self):
+                try:
+                    BaseHTTPRequestHandler.handle(self)
+                except OSError:
+                    pass
+
+            def do_GET(self):
+                if not self.path.endswith(";csv"):
+                    self.send_error(404)
+                    return
+                if fake.latency:
+                    time.sleep(fake.latency)
+                output = fake.stat()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(output)))
+                self.end_headers()
+                self.wfile.write(output)
+                with fake._lock:
+                    fake.commands += 1
+                    fake.bytes_sent += len(output)
+
+            def log_message(self, format, *args):
+                pass
+
+        host, _, port = http_address.rpartition(":")
+        self._http_server = ThreadingHTTPServer((host, int(port)), StatsPageHandler)
+        self._http_server.daemon_threads = True
+        threading.Thread(target=self._http_server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close()
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+        if not self.socket_file.startswith("tcp://") and os.path.exists(self.socket_file):
+            os.unlink(self.socket_file)
+
+
+def start_fake_haproxy(socket_file=None, socketdir=None, processes=1, http_address=None, **topology):
+    """Start one fake process on socket_file or several, one socket each, in socketdir."""
+    if socketdir:
+        os.makedirs(socketdir, exist_ok=True)
+        return [FakeHaproxy(os.path.join(socketdir, "haproxy{}.sock".format(process_num)),
+                            process_num=process_num, **topology).start()
+                for process_num in range(1, processes + 1)]
+    return [FakeHaproxy(socket_file, **topology).start(http_address)]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__)
+    socket_location = parser.add_mutually_exclusive_group(required=True)
+    socket_location.add_argument('-f', '--socketfile', action='store',
+                                 help='path of the socket to create, or tcp://host:port')
+    socket_location.add_argument('-s', '--socketdir', action='store',
+                                 help='directory to create one socket per process in')
+    parser.add_argument('--processes', action='store', type=int, default=1,
+                        help='number of haproxy processes, requires --socketdir')
+    parser.add_argument('--frontends', action='store', type=int, default=2,
+                        help='number of frontends')
+    parser.add_argument('--backends', action='store', type=int, default=3,
+                        help='number of backends')
+    parser.add_argument('--servers', action='store', type=int, default=4,
+                        help='number of servers per backend')
+    parser.add_argument('--latency', action='store', type=float, default=0, metavar='SECONDS',
+                        help='delay before answering a request')
+    parser.add_argument('--seed', action='store', type=int, default=0,
+                        help='seed for the generated values')
+    parser.add_argument('--http', action='store', default=None, metavar='[HOST]:PORT',
+                        help='also serve the stats page CSV export on this address, requires --socketfile')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    fakes = start_fake_haproxy(args.socketfile, args.socketdir, args.processes, args.http, frontends=args.frontends,
+                               backends=args.backends, servers=args.servers, latency=args.latency, seed=args.seed)
+    print("Serving {} fake haproxy process(es): {}".format(len(fakes), ", ".join(
+        [fake.socket_file for fake in fakes])))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for fake in fakes:
+            fake.stop()
+
+
+if __name__ == '__main__':
+    main()